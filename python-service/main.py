@@ -3,18 +3,46 @@ Image Feature Extraction Service using CLIP
 Industry-standard approach used by major e-commerce platforms
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from transformers import CLIPModel, CLIPProcessor
 from PIL import Image
+from torchvision.io import decode_image, ImageReadMode
+from torchvision.transforms import v2
 import torch
+import asyncio
+import base64
+import inspect
 import io
+import mmap
 import numpy as np
+import orjson
 import logging
 import os
+import threading
 import time
-from typing import List
+from typing import List, Literal
+
+# Optional inference backends; the PyTorch path is used when none is installed
+try:
+    import tensorrt as trt
+except ImportError:
+    trt = None
+
+try:
+    import openvino as ov
+    import nncf
+except ImportError:
+    ov = None
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+except ImportError:
+    ort = None
 
 # Configure logging
 logging.basicConfig(
@@ -27,15 +55,611 @@ logger = logging.getLogger(__name__)
 model = None
 processor = None
 device = None
+backend = None
+input_dtype = torch.float32
+static_batch_shapes = False
+batch_input = None
+batch_output = None
+inference_stream = None
+clip_mean_t = None
+clip_inv_std_t = None
+request_queue = None
+batch_worker_task = None
+
+# PIL decode and CLIP preprocessing are CPU-bound and run here, off the event loop
+preprocess_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+# Forward passes always run on this one thread; compiled CUDA graphs are recorded per thread
+inference_executor = ThreadPoolExecutor(max_workers=1)
+# Per preprocessing thread: upload read buffer, pinned staging buffer and CUDA stream
+_thread_local = threading.local()
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+CLIP_MEAN = [0.48145466, 0.4578275, 0.40821073]
+CLIP_STD = [0.26862954, 0.26130258, 0.27577711]
+
+# Same resize/crop as CLIPProcessor, but runs on tensors on the model's device
+clip_resize_crop = torch.nn.Sequential(
+    v2.Resize(224, interpolation=v2.InterpolationMode.BICUBIC, antialias=True),
+    v2.CenterCrop(224),
+)
+# auto: TensorRT on CUDA, OpenVINO (then ONNX Runtime) INT8 on CPU, PyTorch when those aren't installed
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "auto").lower()
+# Output of scripts/quantize_clip_ov.py, served when CLIP_BACKEND=openvino-int8
+CLIP_INT8_MODEL_DIR = os.getenv("CLIP_INT8_MODEL_DIR", "./models/clip-int8")
+INT8_PTQ_MODEL_FILE = "clip-vitb32-int8-ptq.xml"
+# Requests arriving within BATCH_TIMEOUT of each other share one forward pass
+MAX_BATCH = int(os.getenv("CLIP_MAX_BATCH", "32"))
+BATCH_TIMEOUT = float(os.getenv("CLIP_BATCH_TIMEOUT_MS", "5")) / 1000
+# Static-shape encoders (torch.compile, CUDA graphs) are built for these sizes; batches pad up to the next one
+STATIC_BATCH_SIZES = sorted({size for size in (1, 2, 4, 8, 16) if size < MAX_BATCH} | {MAX_BATCH})
+# auto: bf16 on Ampere+ GPUs, fp16 on older GPUs, fp32 on CPU
+CLIP_DTYPE = os.getenv("CLIP_DTYPE", "auto").lower()
+DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+# torch.compile the PyTorch vision tower on CUDA
+CLIP_COMPILE = os.getenv("CLIP_COMPILE", "1") == "1"
+# Capture CUDA graphs of the PyTorch encoder when torch.compile isn't in use
+CLIP_CUDA_GRAPHS = os.getenv("CLIP_CUDA_GRAPHS", "1") == "1"
+# Per-thread read/pinned staging buffers are kept for uploads and decoded frames up to this size (48MB ~ 16MP RGB);
+# larger ones get one-off pageable buffers and a synchronous copy
+MAX_THREAD_BUFFER_BYTES = int(os.getenv("CLIP_THREAD_BUFFER_MB", "48")) * 1024 * 1024
+
+# Inputs are always 224x224, so cuDNN's autotuned conv algorithm is picked once and reused
+torch.backends.cudnn.benchmark = True
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+# Leave half the cores to the preprocessing pool instead of oversubscribing them with intra-op threads
+torch.set_num_threads(max(1, (os.cpu_count() or 1) // 2))
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    # Already fixed once any inter-op work has run (e.g. module re-imported by the reloader)
+    pass
+
+
+class CLIPImageEmbedder(torch.nn.Module):
+    """CLIP vision tower + projection + L2 normalization as a single graph"""
+
+    backend_name = "pytorch"
+    quantization = None
+
+    def __init__(self, clip_model):
+        super().__init__()
+        self.vision_model = clip_model.vision_model
+        self.visual_projection = clip_model.visual_projection
+
+    def forward(self, pixel_values):
+        pooled_output = self.vision_model(pixel_values=pixel_values).pooler_output
+        image_embeds = self.visual_projection(pooled_output)
+        return torch.nn.functional.normalize(image_embeds.float(), dim=-1)
+
+    def get_image_features(self, pixel_values):
+        return self(pixel_values)
+
+
+class TensorRTImageEncoder:
+    """Serves normalized CLIP image embeddings from a serialized TensorRT engine"""
+
+    backend_name = "tensorrt"
+    quantization = None
+
+    def __init__(self, plan_path):
+        self.runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        with open(plan_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as plan:
+            self.engine = self.runtime.deserialize_cuda_engine(plan)
+        if self.engine is None:
+            raise RuntimeError(f"Could not deserialize TensorRT engine {plan_path}")
+        self.context = self.engine.create_execution_context()
+        self.stream = torch.cuda.Stream()
+
+        # Buffers are allocated through torch so TensorRT shares its CUDA context
+        self.input = torch.empty(MAX_BATCH, 3, 224, 224, device="cuda")
+        self.output = torch.empty(MAX_BATCH, 512, device="cuda")
+        self.output_host = torch.empty(MAX_BATCH, 512, pin_memory=True)
+        self.context.set_tensor_address("pixel_values", self.input.data_ptr())
+        self.context.set_tensor_address("image_embeds", self.output.data_ptr())
+
+    def get_image_features(self, pixel_values):
+        n = pixel_values.shape[0]
+        self.context.set_input_shape("pixel_values", tuple(pixel_values.shape))
+        self.stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.stream):
+            self.input[:n].copy_(pixel_values, non_blocking=True)
+            self.context.execute_async_v3(self.stream.cuda_stream)
+            self.output_host[:n].copy_(self.output[:n], non_blocking=True)
+        self.stream.synchronize()
+        return self.output_host[:n].clone()
+
+
+class OpenVINOImageEncoder:
+    """Serves normalized CLIP image embeddings from an INT8 weight-compressed OpenVINO model"""
+
+    backend_name = "openvino"
+    quantization = "int8-weights"
+
+    def __init__(self, xml_path):
+        core = ov.Core()
+        # Compiled blobs are cached next to the IR so later starts skip compilation
+        core.set_property({"CACHE_DIR": os.path.dirname(xml_path)})
+        self.compiled_model = core.compile_model(xml_path, "CPU")
+
+    def get_image_features(self, pixel_values):
+        return torch.from_numpy(self.compiled_model(pixel_values.numpy())[0])
+
+
+class OpenVINOPTQImageEncoder(OpenVINOImageEncoder):
+    """Serves normalized CLIP image embeddings from the calibrated INT8 model built by scripts/quantize_clip_ov.py"""
+
+    quantization = "int8-ptq"
+
+
+class ONNXRuntimeImageEncoder:
+    """Serves normalized CLIP image embeddings from a dynamically quantized INT8 ONNX model"""
+
+    backend_name = "onnxruntime"
+    quantization = "int8-dynamic"
+
+    def __init__(self, onnx_path):
+        self.session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+    def get_image_features(self, pixel_values):
+        (image_embeds,) = self.session.run(["image_embeds"], {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(image_embeds)
+
+
+class CUDAGraphImageEncoder:
+    """Replays CUDA graphs of a CLIPImageEmbedder captured for each of STATIC_BATCH_SIZES"""
+
+    backend_name = "pytorch"
+    quantization = None
+
+    def __init__(self, embedder, static_input):
+        self.static_input = static_input
+        self.graphs = {}
+        self.static_outputs = {}
+        batch_sizes = STATIC_BATCH_SIZES
+
+        # Warm up on a side stream so lazy initialization isn't captured into the graphs
+        warmup_stream = torch.cuda.Stream()
+        warmup_stream.wait_stream(torch.cuda.current_stream())
+        with torch.inference_mode(), torch.cuda.stream(warmup_stream):
+            for batch_size in batch_sizes:
+                for _ in range(3):
+                    embedder(static_input[:batch_size])
+        torch.cuda.current_stream().wait_stream(warmup_stream)
+
+        pool = None
+        with torch.inference_mode():
+            for batch_size in batch_sizes:
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph, pool=pool):
+                    self.static_outputs[batch_size] = embedder(static_input[:batch_size])
+                self.graphs[batch_size] = graph
+                pool = graph.pool()
+
+    def get_image_features(self, pixel_values):
+        batch_size = pixel_values.shape[0]
+        if pixel_values.data_ptr() != self.static_input.data_ptr():
+            self.static_input[:batch_size].copy_(pixel_values, non_blocking=True)
+        self.graphs[batch_size].replay()
+        return self.static_outputs[batch_size]
+
 
-def load_model_with_retry(max_retries=3, retry_delay=5):
-    """Load CLIP model with retry logic for network issues"""
-    global model, processor, device
+def export_vision_onnx(clip_model, onnx_path):
+    """Export CLIPImageEmbedder to ONNX with a dynamic batch dimension"""
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    embedder = CLIPImageEmbedder(clip_model).eval()
+    dummy = torch.zeros(1, 3, 224, 224, device=next(embedder.parameters()).device)
+    # Newer torch defaults to the dynamo exporter, whose graphs the ONNX Runtime quantizer rejects
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            embedder,
+            (dummy,),
+            onnx_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+            **export_kwargs,
+        )
+
+
+def build_trt_engine(clip_model, plan_path):
+    """Export the CLIP vision tower to ONNX and build an FP16 TensorRT engine from it"""
+    onnx_path = os.path.splitext(plan_path)[0] + ".onnx"
+    export_vision_onnx(clip_model, onnx_path)
+
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(trt_logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, trt_logger)
+    if not parser.parse_from_file(onnx_path):
+        errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+        raise RuntimeError(f"Failed to parse {onnx_path}: {errors}")
+
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.FP16)
+    profile = builder.create_optimization_profile()
+    profile.set_shape(
+        "pixel_values",
+        (1, 3, 224, 224),
+        (MAX_BATCH, 3, 224, 224),
+        (MAX_BATCH, 3, 224, 224),
+    )
+    config.add_optimization_profile(profile)
+    serialized_engine = builder.build_serialized_network(network, config)
+    if serialized_engine is None:
+        raise RuntimeError("TensorRT engine build failed")
+
+    # Written under a temporary name so an interrupted build never leaves a truncated plan behind
+    tmp_path = f"{plan_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(serialized_engine)
+    os.replace(tmp_path, plan_path)
+
+
+def load_tensorrt_encoder(clip_model, cache_dir):
+    """Return a TensorRT encoder for clip_model, or clip_model itself when TensorRT can't be used"""
+    if trt is None:
+        if CLIP_BACKEND == "tensorrt":
+            logger.warning("   ⚠️ CLIP_BACKEND=tensorrt but TensorRT is not installed, using PyTorch")
+        return clip_model
+
+    major, minor = torch.cuda.get_device_capability()
+    # Plans only deserialize on the GPU architecture and TensorRT version that built them
+    plan_name = f"clip-vitb32-sm{major}{minor}-b{MAX_BATCH}-trt{trt.__version__}.plan"
+    plan_path = os.path.join(cache_dir, "tensorrt", plan_name)
+
+    try:
+        encoder = None
+        if os.path.exists(plan_path):
+            try:
+                encoder = TensorRTImageEncoder(plan_path)
+            except Exception as e:
+                logger.warning(f"   ⚠️ Cached TensorRT engine unusable ({e}), rebuilding")
+                os.remove(plan_path)
+        if encoder is None:
+            logger.info("   🔧 Building TensorRT FP16 engine (one-time, may take a few minutes)...")
+            build_start = time.time()
+            build_trt_engine(clip_model, plan_path)
+            logger.info(f"   ✅ TensorRT engine built in {time.time() - build_start:.1f}s")
+            encoder = TensorRTImageEncoder(plan_path)
+    except Exception as e:
+        logger.warning(f"   ⚠️ TensorRT engine unavailable ({e}), using PyTorch")
+        return clip_model
+
+    logger.info(f"   - TensorRT engine: {plan_path}")
+    return encoder
+
+
+def load_cpu_encoder(clip_model, cache_dir):
+    """Return an INT8 OpenVINO or ONNX Runtime encoder for clip_model, or clip_model itself"""
+    onnx_path = os.path.join(cache_dir, "onnx", "clip-vitb32.onnx")
+    
+    if ov is not None and CLIP_BACKEND == "openvino-int8":
+        ptq_path = os.path.join(CLIP_INT8_MODEL_DIR, INT8_PTQ_MODEL_FILE)
+        if os.path.exists(ptq_path):
+            try:
+                logger.info(f"   - OpenVINO INT8 PTQ model: {ptq_path}")
+                return OpenVINOPTQImageEncoder(ptq_path)
+            except Exception as e:
+                logger.warning(f"   ⚠️ OpenVINO INT8 PTQ model unavailable ({e})")
+        else:
+            logger.warning(f"   ⚠️ {ptq_path} not found (run scripts/quantize_clip_ov.py), using weight-only INT8")
+    
+    if ov is not None and CLIP_BACKEND in ("auto", "openvino", "openvino-int8"):
+        xml_path = os.path.join(cache_dir, "openvino", "clip-vitb32-int8.xml")
+        try:
+            if not os.path.exists(xml_path):
+                logger.info("   🔧 Converting CLIP to OpenVINO INT8 (one-time)...")
+                if not os.path.exists(onnx_path):
+                    export_vision_onnx(clip_model, onnx_path)
+                ov_model = nncf.compress_weights(ov.convert_model(onnx_path), mode=nncf.CompressWeightsMode.INT8_ASYM)
+                ov.save_model(ov_model, xml_path)
+            logger.info(f"   - OpenVINO model: {xml_path}")
+            return OpenVINOImageEncoder(xml_path)
+        except Exception as e:
+            logger.warning(f"   ⚠️ OpenVINO backend unavailable ({e})")
+    
+    if ort is not None and CLIP_BACKEND in ("auto", "onnxruntime"):
+        int8_path = os.path.join(cache_dir, "onnx", "clip-vitb32-int8.onnx")
+        try:
+            if not os.path.exists(int8_path):
+                logger.info("   🔧 Quantizing CLIP to ONNX INT8 (one-time)...")
+                if not os.path.exists(onnx_path):
+                    export_vision_onnx(clip_model, onnx_path)
+                quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+            logger.info(f"   - ONNX model: {int8_path}")
+            return ONNXRuntimeImageEncoder(int8_path)
+        except Exception as e:
+            logger.warning(f"   ⚠️ ONNX Runtime backend unavailable ({e})")
+    
+    if CLIP_BACKEND in ("openvino", "openvino-int8", "onnxruntime"):
+        logger.warning(f"   ⚠️ CLIP_BACKEND={CLIP_BACKEND} could not be loaded, using PyTorch")
+    return clip_model
+
+
+def resolve_dtype():
+    """Pick the PyTorch inference dtype from CLIP_DTYPE; half precision is only used on CUDA"""
+    if device != "cuda":
+        return torch.float32
+    if CLIP_DTYPE in DTYPES:
+        return DTYPES[CLIP_DTYPE]
+    major, _ = torch.cuda.get_device_capability()
+    return torch.bfloat16 if major >= 8 else torch.float16
+
+
+def load_pretrained(model_name, load_dtype):
+    """Load CLIP weights and processor from the local cache, only contacting the Hub on a cache miss"""
+    model_kwargs = dict(use_safetensors=True, torch_dtype=load_dtype, low_cpu_mem_usage=True)
+    
+    def load(local_files_only):
+        # Weights and processor files are fetched concurrently
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            model_future = pool.submit(
+                CLIPModel.from_pretrained, model_name, local_files_only=local_files_only, **model_kwargs
+            )
+            processor_future = pool.submit(CLIPProcessor.from_pretrained, model_name, local_files_only=local_files_only)
+            return model_future.result(), processor_future.result()
+    
+    try:
+        clip_model, clip_processor = load(local_files_only=True)
+        logger.info("   📦 Loaded model files from local cache")
+        return clip_model, clip_processor
+    except OSError:
+        logger.info("   📥 Downloading model files (this may take a while on first run)...")
+    
+    return load(local_files_only=False)
+
+
+def compile_vision_model(embedder):
+    """torch.compile the vision tower and record its graphs for each of STATIC_BATCH_SIZES"""
+    eager_vision_model = embedder.vision_model
+    embedder.vision_model = torch.compile(
+        eager_vision_model, mode="reduce-overhead", fullgraph=True, dynamic=False
+    )
+    
+    try:
+        with torch.cuda.stream(inference_stream), torch.inference_mode():
+            for batch_size in STATIC_BATCH_SIZES:
+                dummy = torch.zeros(batch_size, 3, 224, 224, device=device, dtype=input_dtype)
+                for _ in range(3):
+                    embedder(dummy)
+        torch.cuda.synchronize()
+    except Exception as e:
+        logger.warning(f"   ⚠️ torch.compile failed ({e}), using eager mode")
+        embedder.vision_model = eager_vision_model
+        return False
+    
+    return True
+
+
+def compute_embeddings(pixel_values_list):
+    """Run the active backend on preprocessed images and return their L2-normalized embeddings"""
+    n = len(pixel_values_list)
+    with torch.cuda.stream(inference_stream):
+        torch.cat(pixel_values_list, out=batch_input[:n])
+    
+    # Compiled graphs exist for STATIC_BATCH_SIZES only; pad to the next one up and ignore rows past n
+    batch_size = next(size for size in STATIC_BATCH_SIZES if size >= n) if static_batch_shapes else n
+    
+    with torch.cuda.stream(inference_stream), torch.inference_mode():
+        image_features = model.get_image_features(pixel_values=batch_input[:batch_size])[:n]
+        if not image_features.is_cuda:
+            return image_features.numpy()
+        
+        # Copy into pinned memory and wait on the inference stream only, not the whole device
+        embeddings = batch_output[:n]
+        embeddings.copy_(image_features, non_blocking=True)
+        inference_stream.synchronize()
+    
+    # batch_output is reused by the next batch while callers may still be serializing this one
+    return embeddings.numpy().copy()
+
+
+def warmup_model():
+    """Run dummy batches through the active backend so the first request doesn't pay for lazy initialization"""
+    dummy = torch.zeros(1, 3, 224, 224, device=device, dtype=input_dtype)
+    for batch_size in sorted({1, MAX_BATCH}):
+        for _ in range(3):
+            compute_embeddings([dummy] * batch_size)
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def _preprocess_stream():
+    """This thread's CUDA stream for uploads and GPU preprocessing (None on CPU)"""
+    if device != "cuda":
+        return None
+    if not hasattr(_thread_local, "stream"):
+        _thread_local.stream = torch.cuda.Stream()
+    return _thread_local.stream
+
+
+def _to_device(tensor):
+    """Copy a CPU tensor to the device through this thread's pinned staging buffer"""
+    if device != "cuda":
+        return tensor
+    # Page-locked memory is scarce; oversized frames take a plain pageable copy instead of growing the buffer
+    if tensor.nbytes > MAX_THREAD_BUFFER_BYTES:
+        return tensor.to(device)
+    
+    staging = getattr(_thread_local, "staging", None)
+    if staging is None or staging.numel() < tensor.nbytes:
+        staging = _thread_local.staging = torch.empty(tensor.nbytes, dtype=torch.uint8, pin_memory=True)
+    
+    pinned = staging[:tensor.nbytes].view(tensor.dtype).view(tensor.shape)
+    pinned.copy_(tensor)
+    return pinned.to(device, non_blocking=True)
+
+
+def _check_image_size(upload_file):
+    """Apply PIL's decompression-bomb check to the upload's header; torchvision decodes without it"""
+    upload_file.seek(0)
+    # Only the header is parsed; Image.open raises DecompressionBombError past 2x MAX_IMAGE_PIXELS
+    # (and only warns between 1x and 2x) and leaves a caller-provided file open
+    with Image.open(upload_file):
+        pass
+
+
+def _read_upload(upload_file):
+    """Read an upload's spooled file into this thread's reusable buffer and return a view of it"""
+    upload_file.seek(0, os.SEEK_END)
+    size = upload_file.tell()
+    upload_file.seek(0)
+    
+    buffer = getattr(_thread_local, "read_buffer", None)
+    if size > MAX_THREAD_BUFFER_BYTES:
+        buffer = bytearray(size)
+    elif buffer is None or len(buffer) < size:
+        buffer = _thread_local.read_buffer = bytearray(size)
+    
+    image_bytes = memoryview(buffer)[:size]
+    read = 0
+    while read < size:
+        n = upload_file.readinto(image_bytes[read:])
+        if not n:
+            break
+        read += n
+    return image_bytes[:read]
+
+
+def _preprocess_on_device(image_bytes):
+    """Decode an uploaded image into normalized [1, 3, 224, 224] pixel_values on the device"""
+    try:
+        image = decode_image(torch.frombuffer(image_bytes, dtype=torch.uint8), mode=ImageReadMode.RGB)
+    except (RuntimeError, ValueError):
+        # torchvision only decodes JPEG/PNG/WebP/GIF; anything else goes through PIL
+        pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        if pil_image.size != (224, 224):
+            return _to_device(processor(images=pil_image, return_tensors="pt").pixel_values)
+        image = torch.from_numpy(np.array(pil_image)).permute(2, 0, 1)
+    
+    # Animated GIFs decode to [frames, 3, H, W]; like PIL, only the first frame is used
+    if image.ndim == 4:
+        image = image[0]
+    # Newer torchvision decodes 16-bit PNGs as uint16; resize and normalize expect 8-bit pixels
+    if image.dtype != torch.uint8:
+        image = v2.functional.to_dtype(image, torch.uint8, scale=True)
+    
+    image = _to_device(image).unsqueeze(0)
+    # Images already at CLIP's input size (common from client-side resizers) skip resize and crop
+    if image.shape[-2:] != (224, 224):
+        image = clip_resize_crop(image)
+    # Pixels are uint8 and clip_mean_t/clip_inv_std_t are prescaled to 0-255: CLIPProcessor's rescale + normalize
+    return (image.float() - clip_mean_t) * clip_inv_std_t
+
+
+def _decode_and_preprocess(upload_file):
+    """Read and decode an uploaded image and turn it into CLIP pixel_values on the model's device"""
+    _check_image_size(upload_file)
+    image_bytes = _read_upload(upload_file)
+    stream = _preprocess_stream()
+    
+    with torch.cuda.stream(stream):
+        pixel_values = _preprocess_on_device(image_bytes).to(input_dtype)
+    
+    # Reject malformed results here so they fail only this request, not the whole coalesced batch
+    if pixel_values.shape != (1, 3, 224, 224):
+        raise ValueError(f"Unexpected preprocessed image shape {tuple(pixel_values.shape)}")
+    
+    # The upload must finish before this thread's staging buffer is reused
+    if stream is not None:
+        stream.synchronize()
+    return pixel_values
+
+
+async def preprocess(file):
+    """Read, decode and preprocess an UploadFile in the preprocessing thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(preprocess_executor, _decode_and_preprocess, file.file)
+
+
+class NumpyJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, which serializes numpy arrays without tolist()"""
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def format_embedding(embedding, encoding):
+    """Response fields for one embedding: a JSON float list, or base64 of its float16 bytes"""
+    if encoding == "raw_fp16":
+        return {
+            "embedding_b64": base64.b64encode(embedding.astype(np.float16).tobytes()).decode("ascii"),
+            "dtype": "float16",
+            "dimension": len(embedding)
+        }
+    
+    return {
+        "embedding": embedding,
+        "dimension": len(embedding)
+    }
+
+
+async def batch_worker():
+    """Coalesce queued images into batches of up to MAX_BATCH and run one forward pass per batch"""
+    loop = asyncio.get_running_loop()
+    carry_over = None
+    
+    while True:
+        pending = [carry_over or await request_queue.get()]
+        carry_over = None
+        batch_size = len(pending[0][0])
+        deadline = loop.time() + BATCH_TIMEOUT
+        while batch_size < MAX_BATCH:
+            try:
+                item = await asyncio.wait_for(request_queue.get(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            if batch_size + len(item[0]) > MAX_BATCH:
+                carry_over = item
+                break
+            pending.append(item)
+            batch_size += len(item[0])
+        
+        # Callers that disconnected while queued have their futures cancelled
+        pending = [(images, future) for images, future in pending if not future.done()]
+        if not pending:
+            continue
+        
+        try:
+            pixel_values_list = [pixel_values for images, _ in pending for pixel_values in images]
+            embeddings = await loop.run_in_executor(inference_executor, compute_embeddings, pixel_values_list)
+        except Exception as e:
+            logger.error(f"❌ Batch of {len(pending)} requests failed: {e}")
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        offset = 0
+        for images, future in pending:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(images)])
+            offset += len(images)
+
+
+async def embed_images(pixel_values_list):
+    """Queue up to MAX_BATCH preprocessed images for the batch worker and wait for their embeddings"""
+    future = asyncio.get_running_loop().create_future()
+    await request_queue.put((pixel_values_list, future))
+    return await future
+
+
+def _load_model_sync(max_retries=3, retry_delay=5):
+    """Load CLIP model with retry logic for network issues; blocking, so lifespan runs it in a thread"""
+    global model, processor, device, backend, input_dtype, static_batch_shapes
+    global batch_input, batch_output, inference_stream, clip_mean_t, clip_inv_std_t
     
     device = "cuda" if torch.cuda.is_available() else "cpu"
     logger.info(f"Using device: {device}")
     
-    model_name = "openai/clip-vit-base-patch32"
+    # Normalization constants live on the device once instead of being rebuilt per request
+    clip_mean_t = torch.tensor(CLIP_MEAN, device=device).view(1, 3, 1, 1) * 255
+    clip_inv_std_t = 1.0 / (torch.tensor(CLIP_STD, device=device).view(1, 3, 1, 1) * 255)
+    
+    model_name = MODEL_NAME
     cache_dir = os.getenv("HF_HOME", os.path.expanduser("~/.cache/huggingface"))
     
     logger.info("🔄 Loading CLIP model...")
@@ -51,24 +675,75 @@ def load_model_with_retry(max_retries=3, retry_delay=5):
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
             
-            logger.info("   📥 Downloading model files (this may take a while on first run)...")
             start_time = time.time()
             
-            model = CLIPModel.from_pretrained(model_name)
-            processor = CLIPProcessor.from_pretrained(model_name)
+            # TensorRT/OpenVINO/ONNX Runtime are exported from fp32 weights; PyTorch-only loads go straight to the serving dtype
+            load_dtype = torch.float32 if CLIP_BACKEND in ("auto", "tensorrt") else resolve_dtype()
+            model, processor = load_pretrained(model_name, load_dtype)
             
             download_time = time.time() - start_time
-            logger.info(f"   ✅ Model files downloaded in {download_time:.1f}s")
+            logger.info(f"   ✅ Model files loaded in {download_time:.1f}s")
             
             # Move model to device
             logger.info(f"   🔄 Moving model to {device}...")
             model = model.to(device)
             model.eval()
             
+            if device == "cuda" and CLIP_BACKEND in ("auto", "tensorrt"):
+                model = load_tensorrt_encoder(model, cache_dir)
+            elif device == "cpu" and CLIP_BACKEND in ("auto", "openvino", "openvino-int8", "onnxruntime"):
+                model = load_cpu_encoder(model, cache_dir)
+            elif CLIP_BACKEND != "torch":
+                # e.g. a CPU-only backend on a CUDA host, TensorRT without a GPU, or an unknown value
+                logger.warning(f"   ⚠️ CLIP_BACKEND={CLIP_BACKEND} is not available on {device}, using PyTorch")
+
+            backend = getattr(model, "backend_name", "pytorch")
+            if backend != "pytorch" and device == "cuda":
+                torch.cuda.empty_cache()
+            
+            # Exported backends take fp32 input and pick their own internal precision
+            if backend == "pytorch":
+                # Only the vision tower is served; normalization happens inside the module
+                model = CLIPImageEmbedder(model)
+                input_dtype = resolve_dtype()
+                model = model.to(input_dtype)
+            
+            # Batches are assembled in place here instead of allocating a new tensor per batch
+            batch_input = torch.zeros(MAX_BATCH, 3, 224, 224, device=device, dtype=input_dtype)
+            if device == "cuda":
+                # All forward passes share one stream and copy their results out through pinned memory
+                inference_stream = torch.cuda.Stream()
+                batch_output = torch.empty(MAX_BATCH, 512, dtype=torch.float32, pin_memory=True)
+            
+            if backend == "pytorch" and device == "cuda":
+                if CLIP_COMPILE and hasattr(torch, "compile"):
+                    logger.info("   🔧 Compiling vision encoder with torch.compile...")
+                    compile_start = time.time()
+                    static_batch_shapes = inference_executor.submit(compile_vision_model, model).result()
+                    if static_batch_shapes:
+                        logger.info(f"   ✅ Vision encoder compiled in {time.time() - compile_start:.1f}s")
+                
+                # reduce-overhead compilation already replays CUDA graphs
+                if not static_batch_shapes and CLIP_CUDA_GRAPHS:
+                    try:
+                        model = CUDAGraphImageEncoder(model, batch_input)
+                        static_batch_shapes = True
+                        logger.info(f"   ✅ CUDA graphs captured for batch sizes {STATIC_BATCH_SIZES}")
+                    except Exception as e:
+                        logger.warning(f"   ⚠️ CUDA graph capture failed ({e}), using eager mode")
+            
+            # cuDNN/cuBLAS algorithm selection, allocator growth and backend JIT happen here
+            warmup_start = time.time()
+            inference_executor.submit(warmup_model).result()
+            warmup_time_ms = (time.time() - warmup_start) * 1000
+            
             logger.info("✅ CLIP model loaded successfully")
             logger.info(f"   - Model: CLIP ViT-B/32")
             logger.info(f"   - Embedding dimension: 512")
             logger.info(f"   - Device: {device}")
+            logger.info(f"   - Backend: {backend}")
+            logger.info(f"   - Input dtype: {input_dtype}")
+            logger.info(f"   - Warmup time: {warmup_time_ms:.0f}ms")
             logger.info(f"   - Total load time: {time.time() - start_time:.1f}s")
             return True
             
@@ -98,13 +773,19 @@ def load_model_with_retry(max_retries=3, retry_delay=5):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown events"""
+    global request_queue, batch_worker_task
+    
     # Startup
     logger.info("=" * 70)
     logger.info("🚀 Starting Python Image Feature Extraction Service")
     logger.info("=" * 70)
     
     try:
-        load_model_with_retry()
+        # Downloads, engine builds and warmup take seconds to minutes; keep the event loop free meanwhile
+        await asyncio.get_running_loop().run_in_executor(None, _load_model_sync)
+        request_queue = asyncio.Queue()
+        batch_worker_task = asyncio.create_task(batch_worker())
+        logger.info(f"   - Dynamic batching: up to {MAX_BATCH} images, {BATCH_TIMEOUT * 1000:.0f}ms window")
         logger.info("✅ Service ready to accept requests")
         logger.info("=" * 70)
     except Exception as e:
@@ -118,11 +799,13 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Shutting down service...")
+    batch_worker_task.cancel()
 
 app = FastAPI(
     title="Image Feature Extraction Service",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=NumpyJSONResponse
 )
 
 # CORS middleware
@@ -149,96 +832,92 @@ async def health_check():
         "status": "healthy",
         "model_loaded": True,
         "device": device,
+        "backend": backend,
+        "quantization": getattr(model, "quantization", None),
         "model_name": "CLIP ViT-B/32",
         "embedding_dimension": 512
     }
 
 @app.post("/extract-features")
-async def extract_features(file: UploadFile = File(...)):
+async def extract_features(
+    file: UploadFile = File(...),
+    encoding: Literal["json", "raw_fp16"] = Query("json")
+):
     """
     Extract feature vector from image using CLIP
-    Returns: JSON with embedding vector (512 dimensions)
+    Returns: JSON with embedding vector (512 dimensions),
+    or base64 float16 bytes in "embedding_b64" when encoding=raw_fp16
     """
     if model is None or processor is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Read image file
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert RGBA to RGB if needed
-        if image.mode == 'RGBA':
-            image = image.convert('RGB')
+        # Read, decode and preprocess image for CLIP
+        pixel_values = await preprocess(file)
         
-        # Preprocess image for CLIP
-        inputs = processor(images=image, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        
-        # Extract features
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
-            # Normalize features
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            embedding = image_features.cpu().numpy()[0]
+        # Extract features (batched with concurrent requests)
+        embedding = (await embed_images([pixel_values]))[0]
         
         logger.info(f"✅ Extracted features: {len(embedding)} dimensions")
         
-        return {
+        # Returned directly: FastAPI's jsonable_encoder would reject the numpy array
+        return NumpyJSONResponse({
             "success": True,
-            "embedding": embedding.tolist(),
-            "dimension": len(embedding)
-        }
+            **format_embedding(embedding, encoding)
+        })
         
     except Exception as e:
         logger.error(f"❌ Feature extraction failed: {e}")
         raise HTTPException(status_code=500, detail=f"Feature extraction failed: {str(e)}")
 
 @app.post("/extract-features-batch")
-async def extract_features_batch(files: List[UploadFile] = File(...)):
+async def extract_features_batch(
+    files: List[UploadFile] = File(...),
+    encoding: Literal["json", "raw_fp16"] = Query("json")
+):
     """
     Extract features from multiple images (batch processing)
     """
     if model is None or processor is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    results = []
+    # Read and decode all images concurrently; failures are reported per file
+    outcomes = await asyncio.gather(
+        *[preprocess(file) for file in files],
+        return_exceptions=True
+    )
     
-    for file in files:
-        try:
-            image_bytes = await file.read()
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            
-            inputs = processor(images=image, return_tensors="pt")
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                image_features = model.get_image_features(**inputs)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-                embedding = image_features.cpu().numpy()[0]
-            
+    # Encode the decodable images in as few forward passes as possible
+    valid = [i for i, outcome in enumerate(outcomes) if not isinstance(outcome, Exception)]
+    chunks = [valid[i:i + MAX_BATCH] for i in range(0, len(valid), MAX_BATCH)]
+    chunk_embeddings = await asyncio.gather(
+        *[embed_images([outcomes[i] for i in chunk]) for chunk in chunks],
+        return_exceptions=True
+    )
+    for chunk, embeddings in zip(chunks, chunk_embeddings):
+        for row, i in enumerate(chunk):
+            outcomes[i] = embeddings if isinstance(embeddings, Exception) else embeddings[row]
+    
+    results = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"❌ Failed to process {file.filename}: {outcome}")
             results.append({
                 "filename": file.filename,
-                "success": True,
-                "embedding": embedding.tolist(),
-                "dimension": len(embedding)
+                "success": False,
+                "error": str(outcome)
             })
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to process {file.filename}: {e}")
+        else:
             results.append({
                 "filename": file.filename,
-                "success": False,
-                "error": str(e)
+                "success": True,
+                **format_embedding(outcome, encoding)
             })
     
-    return {
+    return NumpyJSONResponse({
         "success": True,
         "results": results
-    }
+    })
 
 if __name__ == "__main__":
     import uvicorn
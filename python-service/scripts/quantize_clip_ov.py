@@ -0,0 +1,91 @@
+"""
+Offline INT8 post-training quantization of the CLIP vision encoder for OpenVINO
+
+Calibrates on a folder of representative images (e.g. product photos) with
+smooth-quant alpha 0.6 and writes the model served by CLIP_BACKEND=openvino-int8.
+
+Usage (from python-service/):
+    python scripts/quantize_clip_ov.py --images /path/to/images
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+import openvino as ov
+import nncf
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+logger = main.logger
+
+
+def find_images(image_dir, limit):
+    """Collect up to limit image paths under image_dir"""
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+                if len(paths) == limit:
+                    return paths
+    return paths
+
+
+def quantize(image_dir, output_dir, subset_size, alpha):
+    """Export the vision encoder, calibrate it on image_dir and save the INT8 model to output_dir"""
+    image_paths = find_images(image_dir, subset_size)
+    if not image_paths:
+        raise SystemExit(f"No images found under {image_dir}")
+    logger.info(f"   - Calibration images: {len(image_paths)}")
+
+    clip_model, processor = main.load_pretrained(main.MODEL_NAME, torch.float32)
+    clip_model.eval()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = os.path.join(tmp_dir, "clip-vitb32.onnx")
+        main.export_vision_onnx(clip_model, onnx_path)
+        ov_model = ov.convert_model(onnx_path)
+
+    def transform_fn(image_path):
+        image = Image.open(image_path).convert("RGB")
+        return processor(images=image, return_tensors="pt").pixel_values.numpy()
+
+    logger.info(f"   🔧 Quantizing with smooth-quant alpha={alpha} (may take several minutes)...")
+    start_time = time.time()
+    quantized_model = nncf.quantize(
+        ov_model,
+        nncf.Dataset(image_paths, transform_fn),
+        model_type=nncf.ModelType.TRANSFORMER,
+        subset_size=len(image_paths),
+        advanced_parameters=nncf.AdvancedQuantizationParameters(
+            smooth_quant_alphas=nncf.AdvancedSmoothQuantParameters(matmul=alpha),
+        ),
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    xml_path = os.path.join(output_dir, main.INT8_PTQ_MODEL_FILE)
+    ov.save_model(quantized_model, xml_path)
+    logger.info(f"✅ INT8 model saved to {xml_path} in {time.time() - start_time:.1f}s")
+    return xml_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", required=True, help="Directory of calibration images")
+    parser.add_argument("--output", default=main.CLIP_INT8_MODEL_DIR, help="Output directory (CLIP_INT8_MODEL_DIR)")
+    parser.add_argument("--subset-size", type=int, default=300, help="Maximum number of calibration images")
+    parser.add_argument("--alpha", type=float, default=0.6, help="Smooth-quant alpha for MatMul layers")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    quantize(args.images, args.output, args.subset_size, args.alpha)